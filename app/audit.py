@@ -1,21 +1,122 @@
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+import os
 from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from .database import SCHEMA_LOCK_ID, AuditSessionLocal, engine
 from . import models
 
+logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_FLUSH_BATCH_SIZE = int(os.getenv("AUDIT_FLUSH_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "2"))
+AUDIT_PARTITION_CHECK_SECONDS = float(os.getenv("AUDIT_PARTITION_CHECK_SECONDS", "21600"))
+
+# Queued by stop() behind every pending entry to tell the flusher to finish
+_STOP = object()
+
+
+class AuditBuffer:
+    """Collects audit entries in memory and writes them to the DB in batches."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._partition_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=AUDIT_BUFFER_SIZE)
+        self._task = asyncio.create_task(self._run())
+        self._partition_task = asyncio.create_task(self._maintain_partitions())
+
+    async def stop(self):
+        if self._partition_task:
+            self._partition_task.cancel()
+            try:
+                await self._partition_task
+            except asyncio.CancelledError:
+                pass
+            self._partition_task = None
+
+        # The flusher writes everything queued ahead of the sentinel, including
+        # a batch it is still collecting, before it returns
+        if self._task:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+
+    def put(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            logger.error("Audit buffer full, dropping entry: %s", entry["action"])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            items = [item]
+            stopping = False
+            deadline = loop.time() + AUDIT_FLUSH_INTERVAL_SECONDS
+            while len(items) < AUDIT_FLUSH_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+            await self._flush(items)
+            if stopping:
+                return
+
+    async def _maintain_partitions(self):
+        # Startup creates partitions a few months ahead; long-lived instances
+        # keep extending them so new months never fall into the default one
+        while True:
+            await asyncio.sleep(AUDIT_PARTITION_CHECK_SECONDS)
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(
+                        text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID}
+                    )
+                    await conn.run_sync(models.create_audit_partitions)
+            except Exception:
+                logger.exception("Failed to create audit_logs partitions")
+
+    async def _flush(self, items: list):
+        try:
+            async with AuditSessionLocal() as session:
+                await session.execute(insert(models.AuditLog), items)
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to write %d audit entries", len(items))
+
+
+audit_buffer = AuditBuffer()
+
 
 def log_action(
-    db: Session,
     user_id: int,
     action: str,
     details: str = None,
     ip_address: str = None
 ):
-    log = models.AuditLog(
+    audit_buffer.put(dict(
         user_id=user_id,
         action=action,
         details=details,
         ip_address=ip_address,
+        # Stamped here rather than by the server default, which would
+        # record when the batch was flushed instead of when it happened
         timestamp=datetime.utcnow()
-    )
-    db.add(log)
-    db.commit()
\ No newline at end of file
+    ))
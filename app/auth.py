@@ -1,11 +1,17 @@
+import hashlib
+import hmac
 import os
 from datetime import datetime, timedelta
 
+from cachetools import TTLCache
+
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .database import get_db
 from . import models
@@ -16,10 +22,15 @@ if not SECRET_KEY:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+AUTH_CACHE_TTL_SECONDS = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# username -> (password digest, token claims) for recent successful logins,
+# so repeat logins within the TTL skip bcrypt. Only touched from the event loop.
+_auth_cache = TTLCache(maxsize=10_000, ttl=AUTH_CACHE_TTL_SECONDS)
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -36,18 +47,47 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        return None
-    if not verify_password(password, user.password_hash):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    user = result.scalar_one_or_none()
+    # Deprovisioned accounts are rejected before paying for bcrypt
+    if not user or not user.is_active:
         return None
-    if not user.is_active:
+    # bcrypt is CPU-bound, keep it off the event loop
+    if not await run_in_threadpool(verify_password, password, user.password_hash):
         return None
     return user
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def _password_digest(password: str) -> bytes:
+    return hmac.new(SECRET_KEY.encode(), password.encode(), hashlib.sha256).digest()
+
+
+async def authenticate_user_cached(db: AsyncSession, username: str, password: str):
+    digest = _password_digest(password)
+    cached = _auth_cache.get(username)
+    if cached and hmac.compare_digest(cached[0], digest):
+        return cached[1]
+
+    user = await authenticate_user(db, username, password)
+    if not user:
+        return None
+
+    claims = {
+        "sub": user.username,
+        "role": user.role.name,
+        "id": user.id,
+        "department": user.department
+    }
+    _auth_cache[username] = (digest, claims)
+    return claims
+
+
+def invalidate_cached_user(username: str):
+    _auth_cache.pop(username, None)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
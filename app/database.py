@@ -1,7 +1,8 @@
 import os
-from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 # ────────────────────────────────────────────────
 # IMPORTANT: Replace with YOUR actual connection name
@@ -16,19 +17,106 @@ if not DB_PASSWORD:
     raise ValueError("Environment variable DB_PASSWORD is not set")
 
 DATABASE_URL = (
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@/"
+    f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@/"
     f"{DB_NAME}?host=/cloudsql/{CLOUD_SQL_CONNECTION_NAME}"
 )
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# LIFO keeps traffic on a small set of hot connections and lets idle
+# overflow connections time out instead of cycling through all of them
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    insertmanyvalues_page_size=1000,
+)
+# Objects stay loaded after commit, so reading them afterwards (e.g. to
+# build the audit entry or the response) doesn't cost another SELECT
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+# Audit batches use their own small pool with synchronous_commit off, so
+# their commits don't wait on the WAL fsync. A crash can lose the last
+# few batches, never the IAM changes themselves.
+audit_engine = create_async_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=2,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    insertmanyvalues_page_size=1000,
+    connect_args={"options": "-c synchronous_commit=off"},
+)
+AuditSessionLocal = async_sessionmaker(audit_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# Arbitrary key for the advisory lock that serialises schema creation
+# when several instances start at the same time
+SCHEMA_LOCK_ID = 727001
+
+
+def _upgrade_enum_columns(conn):
+    # role/status used to be stored as their names in text columns; convert
+    # any that are still text to the SMALLINT values of their IntEnum
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            enum_cls = getattr(column.type, "enum_cls", None)
+            if enum_cls is None:
+                continue
+            data_type = conn.execute(
+                text(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() "
+                    "AND table_name = :table AND column_name = :column"
+                ),
+                {"table": table.name, "column": column.name},
+            ).scalar_one_or_none()
+            if data_type not in ("character varying", "text", "character"):
+                continue
+            cases = " ".join(f"WHEN '{m.name}' THEN {m.value}" for m in enum_cls)
+            conn.execute(text(
+                f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE smallint "
+                f"USING CASE {column.name} {cases} END"
+            ))
+
+
+def _create_schema(conn):
+    Base.metadata.create_all(bind=conn)
+    _upgrade_enum_columns(conn)
+    # create_all skips tables that already exist, so add any indexes
+    # declared since those tables were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        await conn.run_sync(_create_schema)
+
+
+async def _ping(barrier: asyncio.Barrier):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        # Hold the connection until every slot has been opened
+        await barrier.wait()
+
+
+async def warm_pool():
+    # Open every pooled connection up front so the first requests
+    # don't pay the connection setup cost
+    size = engine.pool.size()
+    barrier = asyncio.Barrier(size)
+    await asyncio.gather(*(_ping(barrier) for _ in range(size)))
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -0,0 +1,21 @@
+import httpx
+from fastapi import Request
+
+# One client for the whole app, so outbound calls reuse pooled
+# keep-alive / HTTP/2 connections instead of reconnecting per request
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+
+def get_http(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http
\ No newline at end of file
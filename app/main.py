@@ -1,19 +1,45 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from .database import engine, Base, get_db
+from .database import audit_engine, engine, get_db, init_db, warm_pool
 from . import models, auth
-from .rbac import require_role
-from .audit import log_action
+from .rbac import require_roles
+from .audit import audit_buffer, log_action
+from .http_client import create_http_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await warm_pool()
+    app.state.http = create_http_client()
+    await audit_buffer.start()
+    try:
+        yield
+    finally:
+        await audit_buffer.stop()
+        await app.state.http.aclose()
+        await audit_engine.dispose()
+        await engine.dispose()
 
-app = FastAPI(title="MiniIAM – Identity Lifecycle Simulator")
 
-Base.metadata.create_all(bind=engine)
+app = FastAPI(
+    title="MiniIAM – Identity Lifecycle Simulator",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+PRIVILEGED_ROLES = (models.Role.Admin, models.Role.Manager)
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "MiniIAM is running"}
 
 
@@ -22,48 +48,53 @@ def root():
 # ────────────────────────────────────────────────
 
 @app.post("/register")
-def register(
+async def register(
     username: str,
     password: str,
     role: str,
     department: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    if role not in ["Admin", "Manager", "Employee"]:
+    if role not in models.Role.__members__:
         raise HTTPException(400, "Invalid role")
+    if len(username) > models.USERNAME_MAX_LENGTH:
+        raise HTTPException(400, "Username too long")
 
-    existing = db.query(models.User).filter(models.User.username == username).first()
-    if existing:
+    result = await db.execute(select(models.User.id).where(models.User.username == username))
+    if result.scalar_one_or_none() is not None:
         raise HTTPException(400, "Username already exists")
 
     user = models.User(
         username=username,
-        password_hash=auth.hash_password(password),
-        role=role,
+        password_hash=await run_in_threadpool(auth.hash_password, password),
+        role=models.Role[role],
         department=department,
         is_active=True
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
 
     return {"message": "User created", "username": username}
 
 
 @app.post("/login")
-def login(username: str, password: str, db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, username, password)
-    if not user:
+async def login(username: str, password: str, db: AsyncSession = Depends(get_db)):
+    claims = await auth.authenticate_user_cached(db, username, password)
+    if not claims:
         raise HTTPException(401, "Invalid credentials")
 
-    user.last_login = datetime.utcnow()
-    db.commit()
-    token = auth.create_access_token({
-    "sub": user.username,
-    "role": user.role,
-    "id": user.id,
-    "department": user.department
-    })
+    # The is_active filter also covers cached claims, which may predate a
+    # deprovision on this or another instance
+    result = await db.execute(
+        update(models.User)
+        .where(models.User.id == claims["id"], models.User.is_active)
+        .values(last_login=func.now())
+    )
+    if result.rowcount == 0:
+        auth.invalidate_cached_user(username)
+        raise HTTPException(401, "Invalid credentials")
+    await db.commit()
+    token = auth.create_access_token(claims)
     return {"access_token": token, "token_type": "bearer"}
 
 
@@ -72,24 +103,25 @@ def login(username: str, password: str, db: Session = Depends(get_db)):
 # ────────────────────────────────────────────────
 
 @app.post("/users/{user_id}/deprovision")
-def deprovision(
+async def deprovision(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user = Depends(require_role("Admin")),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(require_roles("Admin")),
     request: Request = None
 ):
-    target = db.query(models.User).filter(models.User.id == user_id).first()
+    target = await db.get(models.User, user_id)
     if not target:
         raise HTTPException(404, "User not found")
     if not target.is_active:
         raise HTTPException(400, "Already inactive")
 
     target.is_active = False
-    db.commit()
+    await db.commit()
+    auth.invalidate_cached_user(target.username)
 
+    details = f"Deprovisioned {target.username} (id {user_id})"
     log_action(
-        db, current_user["id"], "DEPROVISION",
-        f"Deprovisioned {target.username} (id {user_id})",
+        current_user["id"], "DEPROVISION", details,
         request.client.host if request else None
     )
 
@@ -97,63 +129,63 @@ def deprovision(
 
 
 @app.post("/access/request")
-def request_access(
+async def request_access(
     resource: str,
     reason: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(auth.get_current_user),
     request: Request = None
 ):
-    user = db.query(models.User).filter(models.User.username == current_user["username"]).first()
-    req = models.AccessRequest(
-        user_id=user.id,
-        resource=resource,
-        reason=reason
+    if len(resource) > models.RESOURCE_MAX_LENGTH:
+        raise HTTPException(400, "Resource name too long")
+
+    # The token already carries the user's id, no need to look the user up
+    user_id = current_user["id"]
+    result = await db.execute(
+        insert(models.AccessRequest)
+        .values(user_id=user_id, resource=resource, reason=reason)
+        .returning(models.AccessRequest.id)
     )
-    db.add(req)
-    db.commit()
-    db.refresh(req)
+    req_id = result.scalar_one()
+    await db.commit()
 
+    details = f"Requested {resource} – {reason} (request {req_id})"
     log_action(
-        db, user.id, "REQUEST_ACCESS",
-        f"Requested {resource} – {reason}",
+        user_id, "REQUEST_ACCESS", details,
         request.client.host if request else None
     )
 
-    return {"message": "Request submitted", "id": req.id}
+    return {"message": "Request submitted", "id": req_id}
 
 
 @app.post("/access/approve/{req_id}")
-def approve(
+async def approve(
     req_id: int,
-    db: Session = Depends(get_db),
-    current_user = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(require_roles("Admin", "Manager")),
     request: Request = None
 ):
-    req = db.query(models.AccessRequest).filter(models.AccessRequest.id == req_id).first()
+    req = await db.get(models.AccessRequest, req_id)
     if not req:
         raise HTTPException(404, "Request not found")
-    if req.status != "Pending":
+    if req.status != models.RequestStatus.Pending:
         raise HTTPException(400, "Already processed")
 
-    requester = db.query(models.User).get(req.user_id)
-
-    # Approval rules
-    if current_user["role"] == "Admin":
-        pass
-    elif current_user["role"] == "Manager":
-        if requester.department != current_user.get("department"):
+    # Managers can only approve within their own department
+    if current_user["role"] == "Manager":
+        result = await db.execute(
+            select(models.User.department).where(models.User.id == req.user_id)
+        )
+        if result.scalar_one_or_none() != current_user.get("department"):
             raise HTTPException(403, "Can only approve own department")
-    else:
-        raise HTTPException(403, "Not allowed")
 
-    req.status = "Approved"
+    req.status = models.RequestStatus.Approved
     req.approved_by = current_user["username"]
-    db.commit()
+    await db.commit()
 
+    details = f"Approved request {req_id} for {req.resource}"
     log_action(
-        db, current_user["id"], "APPROVE_REQUEST",
-        f"Approved request {req_id} for {req.resource}",
+        current_user["id"], "APPROVE_REQUEST", details,
         request.client.host if request else None
     )
 
@@ -161,29 +193,44 @@ def approve(
 
 
 @app.get("/reports/access-review")
-def access_review(
-    db: Session = Depends(get_db),
-    current_user = Depends(require_role("Admin"))
+async def access_review(
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(require_roles("Admin"))
 ):
-    users = db.query(models.User).all()
-    data = []
-
-    for u in users:
-        data.append({
-            "username": u.username,
-            "role": u.role,
-            "department": u.department or "—",
-            "active": u.is_active,
-            "last_login": u.last_login.isoformat() if u.last_login else "Never",
-            "privileged": u.role in ("Admin", "Manager")
-        })
-
-    return {
-        "generated": datetime.utcnow().isoformat(),
+    # Plain column rows, no ORM objects to build for every user
+    rows = (await db.execute(select(
+        models.User.username,
+        models.User.role,
+        models.User.department,
+        models.User.is_active,
+        models.User.last_login,
+    ))).all()
+    data = [
+        {
+            "username": username,
+            "role": role.name,
+            "department": department or "—",
+            "active": is_active,
+            "last_login": last_login or "Never",
+            "privileged": role in PRIVILEGED_ROLES
+        }
+        for username, role, department, is_active, last_login in rows
+    ]
+
+    total, active, privileged = (await db.execute(select(
+        func.count(),
+        func.count().filter(models.User.is_active),
+        func.count().filter(models.User.role.in_(PRIVILEGED_ROLES)),
+    ))).one()
+
+    # Returned directly so orjson serializes the datetimes itself instead
+    # of FastAPI converting every row through jsonable_encoder first
+    return ORJSONResponse({
+        "generated": datetime.utcnow(),
         "users": data,
         "summary": {
-            "total": len(data),
-            "active": sum(1 for x in data if x["active"]),
-            "privileged": sum(1 for x in data if x["privileged"])
+            "total": total,
+            "active": active,
+            "privileged": privileged
         }
-    }
\ No newline at end of file
+    })
\ No newline at end of file
@@ -1,43 +1,153 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+import logging
+from datetime import datetime
+from enum import IntEnum
+
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy import event, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from .database import Base
 
+logger = logging.getLogger(__name__)
+
+USERNAME_MAX_LENGTH = 64
+RESOURCE_MAX_LENGTH = 255
+AUDIT_PARTITION_MONTHS_AHEAD = 3
+
+
+class Role(IntEnum):
+    Admin = 1
+    Manager = 2
+    Employee = 3
+
+
+class RequestStatus(IntEnum):
+    Pending = 0
+    Approved = 1
+    Rejected = 2
+
+
+class IntEnumType(TypeDecorator):
+    """Stores an IntEnum as a SMALLINT and loads it back as the enum."""
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, enum_cls):
+        super().__init__()
+        self.enum_cls = enum_cls
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.enum_cls(value)
+
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, nullable=False)
+    username = Column(String(USERNAME_MAX_LENGTH), unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    role = Column(String, nullable=False)           # Admin, Manager, Employee
+    role = Column(IntEnumType(Role), nullable=False)
     department = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     last_login = Column(DateTime(timezone=True), nullable=True)
 
-    access_requests = relationship("AccessRequest", back_populates="user")
-    audit_logs     = relationship("AuditLog", back_populates="user")
+    # lazy="raise" so an unplanned per-row lazy load fails loudly instead of N+1
+    access_requests = relationship("AccessRequest", back_populates="user", lazy="raise")
+    audit_logs     = relationship("AuditLog", back_populates="user", lazy="raise")
 
 
 class AccessRequest(Base):
     __tablename__ = "access_requests"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    resource = Column(String, nullable=False)
+    resource = Column(String(RESOURCE_MAX_LENGTH), nullable=False)
     reason = Column(String, nullable=False)
-    status = Column(String, default="Pending")      # Pending / Approved / Rejected
+    status = Column(IntEnumType(RequestStatus), default=RequestStatus.Pending)
     approved_by = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="access_requests")
 
+    __table_args__ = (
+        Index("ix_access_req_status_user", "status", "user_id"),
+    )
+
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
-    id = Column(Integer, primary_key=True, index=True)
+    # Partitioned by month on timestamp, which therefore has to be part of the key
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     action = Column(String, nullable=False)
     details = Column(String, nullable=True)
-    ip_address = Column(String, nullable=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    ip_address = Column(String(45), nullable=True)    # IPv6 max length
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+
+    user = relationship("User", back_populates="audit_logs")
+
+    __table_args__ = (
+        Index("ix_audit_user_ts", "user_id", "timestamp"),
+        Index(
+            "ix_audit_ts_brin", "timestamp",
+            postgresql_using="brin",
+            postgresql_with={"pages_per_range": 32},
+        ),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+def _add_months(d: datetime, months: int) -> datetime:
+    year, month = divmod(d.month - 1 + months, 12)
+    return d.replace(year=d.year + year, month=month + 1)
+
+
+def create_audit_partitions(connection):
+    """Create the default partition and monthly ones up to a few months ahead."""
+    month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    _run_partition_ddl(
+        connection, "audit_logs_default",
+        "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT",
+    )
+    for i in range(AUDIT_PARTITION_MONTHS_AHEAD + 1):
+        start = f"{_add_months(month, i):%Y-%m-%d} 00:00+00"
+        end = f"{_add_months(month, i + 1):%Y-%m-%d} 00:00+00"
+        name = f"audit_logs_{_add_months(month, i):%Y_%m}"
+        _run_partition_ddl(
+            connection, name,
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')",
+            (start, end),
+        )
+
+
+def _run_partition_ddl(connection, name: str, statement: str, bounds: tuple = None):
+    try:
+        with connection.begin_nested():
+            connection.execute(text(statement))
+    except Exception as exc:
+        # check_violation: rows for this month already sit in the default
+        # partition, and the month stays there until they are moved by hand
+        if bounds and getattr(getattr(exc, "orig", None), "sqlstate", None) == "23514":
+            start, end = bounds
+            in_range = f"timestamp >= '{start}' AND timestamp < '{end}'"
+            logger.error(
+                "Cannot create audit_logs partition %s: audit_logs_default already holds "
+                "rows in that range. Move them in one transaction: "
+                "ALTER TABLE audit_logs DETACH PARTITION audit_logs_default; "
+                "CREATE TABLE %s PARTITION OF audit_logs FOR VALUES FROM ('%s') TO ('%s'); "
+                "INSERT INTO %s SELECT * FROM audit_logs_default WHERE %s; "
+                "DELETE FROM audit_logs_default WHERE %s; "
+                "ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT;",
+                name, name, start, end, name, in_range, in_range,
+            )
+        else:
+            logger.warning("Could not create audit_logs partition %s: %s", name, exc)
+
 
-    user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
+@event.listens_for(Base.metadata, "after_create")
+def _create_audit_partitions(target, connection, **kw):
+    # create_all fires this on every startup, even when nothing was created
+    create_audit_partitions(connection)
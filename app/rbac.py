@@ -1,14 +1,24 @@
+from functools import lru_cache
+
 from fastapi import Depends, HTTPException
 
 from .auth import get_current_user
 
 
-def require_role(required_role: str):
-    def role_checker(current_user: dict = Depends(get_current_user)):
-        if current_user["role"] != required_role:
+# Cached so the same roles always give the same dependency object, which
+# lets FastAPI reuse its result within a request
+@lru_cache(maxsize=None)
+def require_roles(*roles: str):
+    allowed = frozenset(roles)
+    required = ", ".join(f"'{role}'" for role in roles)
+
+    async def role_checker(current_user: dict = Depends(get_current_user)):
+        if current_user["role"] not in allowed:
             raise HTTPException(
                 status_code=403,
-                detail=f"Insufficient permissions: requires role '{required_role}'"
+                detail=f"Insufficient permissions: requires role {required}"
             )
         return current_user
+
+    role_checker.__name__ = f"require_roles_{'_'.join(roles)}"
     return role_checker
\ No newline at end of file